@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк краулера поставщиков на локальном тестовом сайте.
+
+Поднимает несколько локальных HTTP-серверов (каждый порт - отдельный "домен"),
+сохраняет снимок выдачи во временную базу данных и выполняет два прохода:
+холодный (полная загрузка) и повторный (условные GET-запросы, ответы 304).
+Перед замером проверяет извлечение контактов на известных случаях.
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from supplier_crawler import SupplierCrawler, extract_contacts
+from rank_history import RankHistory
+import parser_rules as rules
+
+LAST_MODIFIED = formatdate(time.time() - 86400, usegmt=True)
+# Страницы в windows-1251 с кодировкой только в <meta>, без charset в Content-Type
+CP1251_PAGES = {'/rekvizity'}
+
+
+def build_site(site_id):
+    """Страницы тестового сайта поставщика"""
+    filler = '<p>Кирпич облицовочный, доставка по России.</p>' * 200
+    return {
+        '/': f'''<html><body><h1>Поставщик {site_id}</h1>
+            <a href="/contacts">Контакты</a> <a href="/price">Прайс-лист</a>
+            <a href="/about">О компании</a> <a href="/catalog">Каталог</a>
+            <a href="/blocked/kontakty">Контакты для партнеров</a> <a href="/rekvizity">Реквизиты</a>
+            {filler}</body></html>''',
+        '/contacts': f'''<html><body>
+            <a href="mailto:sales{site_id}@example.ru">Написать</a>
+            <p>Телефон: +7 (495) 123-{site_id % 100:02d}-{site_id % 97:02d}</p>
+            <p>ИНН: 7707083893</p>{filler}</body></html>''',
+        '/price': f'''<html><body><a href="/files/price-{site_id}.xlsx">Скачать прайс</a>
+            {filler}</body></html>''',
+        # Контакты в подвале после более чем 64 КБ содержимого
+        '/about': f'''<html><body><p>info{site_id}@example.ru</p>{filler * 10}
+            <footer>footer{site_id}@example.ru</footer></body></html>''',
+        '/catalog': f'<html><body>{filler}</body></html>',
+        '/rekvizity': f'''<html><head><meta http-equiv="Content-Type" content="text/html; charset=windows-1251">
+            </head><body><p>ИНН 7736207543</p><a href="/contacts">Контакты</a>{filler}</body></html>''',
+        '/blocked/kontakty': f'<html><body><p>blocked{site_id}@example.ru</p></body></html>',
+        # Общая группа запрещает все: краулер должен применять группу своего бота
+        '/robots.txt': 'User-agent: B2BSupplierBot\nDisallow: /catalog\nDisallow: /blocked\n\n'
+                       'User-agent: *\nDisallow: /\n',
+    }
+
+
+def make_handler(pages):
+    """Обработчик с поддержкой ETag и Last-Modified"""
+    encoded = {
+        path: body.encode('cp1251' if path in CP1251_PAGES else 'utf-8')
+        for path, body in pages.items()
+    }
+    etags = {path: '"' + hashlib.md5(body).hexdigest() + '"' for path, body in encoded.items()}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            body = encoded.get(self.path)
+            if body is None:
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            etag = etags[self.path]
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+
+            if self.path in CP1251_PAGES:
+                content_type = 'text/html'
+            elif self.path.endswith('.txt'):
+                content_type = 'text/plain; charset=utf-8'
+            else:
+                content_type = 'text/html; charset=utf-8'
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', LAST_MODIFIED)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_sites(count):
+    """Запуск тестовых сайтов на свободных портах"""
+    servers = []
+    for site_id in range(count):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(build_site(site_id)))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+    return servers
+
+
+def check_extraction():
+    """Проверка извлечения на известных ошибочных случаях"""
+    found = extract_contacts('<p>ИНН 781234567890</p>', 'http://example.ru/', [])
+    assert found['phone'] == [], f"Телефон найден внутри ИНН: {found['phone']}"
+
+    found = extract_contacts('<p>Тел.: 8 (812) 123-45-67</p>', 'http://example.ru/', [])
+    assert found['phone'] == ['+78121234567'], found['phone']
+
+
+def check_footer_contacts(db_path, count):
+    """Контакты из подвала длинных страниц должны быть найдены на всех сайтах"""
+    with sqlite3.connect(db_path) as conn:
+        found = conn.execute(
+            "SELECT COUNT(*) FROM supplier_contacts WHERE kind = 'email' AND value LIKE 'footer%'"
+        ).fetchone()[0]
+    assert found == count, f"Контакты из подвала найдены на {found} из {count} сайтов"
+
+
+def check_meta_charset(db_path, count):
+    """ИНН со страницы в windows-1251 (кодировка указана только в <meta>) должен быть найден"""
+    with sqlite3.connect(db_path) as conn:
+        found = conn.execute(
+            "SELECT COUNT(*) FROM supplier_contacts WHERE kind = 'inn' AND value = '7736207543'"
+        ).fetchone()[0]
+    assert found == count, f"ИНН со страницы в windows-1251 найден на {found} из {count} сайтов"
+
+
+def check_robots(db_path, count):
+    """Группа robots.txt для бота краулера должна применяться вместо общей группы"""
+    with sqlite3.connect(db_path) as conn:
+        crawled = conn.execute("SELECT COUNT(DISTINCT domain) FROM crawl_pages WHERE status_code = 200").fetchone()[0]
+        blocked = conn.execute("SELECT COUNT(*) FROM crawl_pages WHERE url LIKE '%/blocked/%'").fetchone()[0]
+    assert crawled == count, f"Загружены страницы только {crawled} из {count} сайтов"
+    assert blocked == 0, f"Загружено {blocked} страниц, запрещенных в robots.txt"
+
+
+def run_pass(db_path, settings, label):
+    crawler = SupplierCrawler(db_path, settings)
+    start_time = time.perf_counter()
+    stats = crawler.run()
+    duration = time.perf_counter() - start_time
+    requests = stats['pages'] + stats['not_modified']
+    print(f"{label}: {duration:.2f} с, доменов {stats['domains']}, страниц {stats['pages']}, "
+          f"304: {stats['not_modified']}, контактов {stats['contacts']}, "
+          f"{requests / duration:.1f} запросов/с")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк краулера поставщиков")
+    parser.add_argument("--sites", type=int, default=50, help="Количество тестовых сайтов")
+    parser.add_argument("--host-delay", type=float, default=0.0, help="Пауза между запросами к одному сайту")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format=rules.LOGGING["format"])
+    check_extraction()
+
+    servers = start_sites(args.sites)
+    db_dir = tempfile.mkdtemp(prefix='crawler_bench_')
+    db_path = os.path.join(db_dir, 'search_results.db')
+
+    RankHistory(db_path).record('кирпич', [
+        {'title': f'Поставщик {i}', 'url': f'http://127.0.0.1:{server.server_address[1]}/',
+         'snippet': '', 'position': i + 1}
+        for i, server in enumerate(servers)
+    ])
+
+    settings = {"host_delay": args.host_delay, "recrawl_after_days": 0}
+    run_pass(db_path, settings, "Холодный проход")
+    check_footer_contacts(db_path, args.sites)
+    check_robots(db_path, args.sites)
+    check_meta_charset(db_path, args.sites)
+    run_pass(db_path, settings, "Повторный проход")
+
+    for server in servers:
+        server.shutdown()
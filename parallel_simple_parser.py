@@ -14,14 +14,22 @@ from concurrent.futures import ThreadPoolExecutor
 import threading
 import sys
 import sqlite3
+import argparse
+from contextlib import nullcontext
 import parser_rules as rules
+from supplier_crawler import SupplierCrawler
+from rank_history import RankHistory, RESULTS_PER_PAGE
+from run_profiler import RunProfiler
 
 class ParallelSimpleParser:
     def __init__(self, query):
         self.query = query
         self.results = []
         self.results_lock = threading.Lock()
+        self.completed_pages = set()
+        self.expected_pages = set()
         self.locations = rules.LOCATIONS
+        self.profiler = None
         
         # Настройка логирования
         self.setup_logging()
@@ -69,40 +77,34 @@ class ParallelSimpleParser:
                 
                 conn.commit()
                 logging.info("База данных успешно инициализирована")
+            
+            self.rank_history = RankHistory()
         except Exception as e:
             logging.error(f"Ошибка при инициализации базы данных: {str(e)}")
             raise
 
     def save_to_database(self):
-        """Сохранение результатов в базу данных"""
+        """
+        Сохранение результатов в базу данных.
+        Выдача хранится только в истории позиций (изменения между снимками),
+        полные строки в search_results больше не добавляются.
+        """
         try:
-            with sqlite3.connect('search_results.db') as conn:
-                cursor = conn.cursor()
-                
-                # Подготавливаем данные для вставки
-                data_to_insert = [
-                    (self.query, result['title'], result['url'], result['snippet'], result['page'])
-                    for result in self.results
-                ]
-                
-                # Вставляем данные
-                cursor.executemany(
-                    'INSERT INTO search_results (query, title, url, snippet, page_num) VALUES (?, ?, ?, ?, ?)',
-                    data_to_insert
-                )
-                
-                conn.commit()
-                logging.info(f"Сохранено {len(data_to_insert)} результатов в базу данных")
-                
-                # Получаем статистику
-                cursor.execute('SELECT COUNT(*) FROM search_results WHERE query = ?', (self.query,))
-                total_results = cursor.fetchone()[0]
-                
-                cursor.execute('SELECT COUNT(DISTINCT url) FROM search_results WHERE query = ?', (self.query,))
-                unique_urls = cursor.fetchone()[0]
-                
-                logging.info(f"Всего в базе для запроса '{self.query}': {total_results} результатов, {unique_urls} уникальных URL")
-                
+            # При неполном запуске изменения считаются только по обработанным страницам,
+            # иначе результаты необработанных страниц попали бы в историю как выход из выдачи
+            missing_pages = self.expected_pages - self.completed_pages
+            if not self.completed_pages:
+                logging.warning("Снимок выдачи не сохранен: ни одна страница не обработана")
+                return
+            if missing_pages:
+                logging.warning(f"Неполный снимок выдачи: не обработаны страницы {sorted(missing_pages)}, "
+                                f"их результаты перенесены из предыдущего снимка")
+                self.rank_history.record(self.query, self.results, pages=self.completed_pages)
+            else:
+                self.rank_history.record(self.query, self.results)
+
+            logging.info(f"Сохранено {len(self.results)} результатов в историю позиций")
+
         except Exception as e:
             logging.error(f"Ошибка при сохранении в базу данных: {str(e)}")
             raise
@@ -166,7 +168,7 @@ class ParallelSimpleParser:
                 logging.info(f"Найдено {len(results)} результатов на странице {page_num}")
                 
                 page_results = []
-                for result in results:
+                for raw_index, result in enumerate(results, start=1):
                     try:
                         # Извлекаем данные с более точными селекторами
                         title_element = await result.query_selector(rules.SELECTORS["title"])
@@ -191,7 +193,9 @@ class ParallelSimpleParser:
                                     'title': title.strip(),
                                     'url': link,
                                     'snippet': snippet.strip(),
-                                    'page': page_num
+                                    'page': page_num,
+                                    # Абсолютная позиция по всем элементам выдачи, включая отфильтрованные
+                                    'position': (page_num - 1) * RESULTS_PER_PAGE + raw_index
                                 })
                                 logging.info(f"Обработан результат: {title[:50]}...")
                                 
@@ -269,14 +273,31 @@ class ParallelSimpleParser:
                 # Настраиваем перехватчик JavaScript
                 await context.add_init_script(rules.ANTI_DETECTION_SCRIPT)
                 
+                # Выборка задач asyncio при профилировании
+                task_sampler = None
+                if self.profiler:
+                    task_sampler = asyncio.create_task(self.profiler.sample_tasks(f"браузер {browser_id}"))
+                
                 try:
                     for page in range(start_page, end_page + 1):
                         logging.info(f"Браузер {browser_id}: обработка страницы {page}")
-                        if not await self.process_page(context, page):
-                            logging.error(f"Браузер {browser_id}: ошибка при обработке страницы {page}")
+                        tracing = self.profiler and self.profiler.should_trace(page)
+                        if tracing:
+                            await browser.start_tracing(path=self.profiler.trace_path(page), screenshots=True)
+                        try:
+                            if await self.process_page(context, page):
+                                with self.results_lock:
+                                    self.completed_pages.add(page)
+                            else:
+                                logging.error(f"Браузер {browser_id}: ошибка при обработке страницы {page}")
+                        finally:
+                            if tracing:
+                                await browser.stop_tracing()
                         await asyncio.sleep(random.uniform(*self.delay_between_requests))
                         
                 finally:
+                    if task_sampler:
+                        task_sampler.cancel()
                     await context.close()
                     await browser.close()
                     
@@ -290,13 +311,32 @@ class ParallelSimpleParser:
         except Exception as e:
             logging.error(f"Ошибка в потоке {browser_id}: {str(e)}")
 
-    def run(self, num_browsers=None, pages_per_browser=None):
-        """Запуск парсера с параллельной обработкой"""
+    def enrich_suppliers(self):
+        """Обогащение данных поставщиков по новым доменам из базы данных"""
+        try:
+            SupplierCrawler(profiler=self.profiler).run()
+        except Exception as e:
+            logging.error(f"Ошибка при обогащении данных поставщиков: {str(e)}")
+
+    def profile_phase(self, name):
+        """Замер этапа при профилировании"""
+        return self.profiler.phase(name) if self.profiler else nullcontext()
+
+    def run(self, num_browsers=None, pages_per_browser=None, enrich=None, profile=False, trace_pages=None,
+            profile_memory=False):
+        """
+        Запуск парсера с параллельной обработкой.
+        profile - сохранить профиль запуска (CPU, задачи asyncio, память) в отдельную директорию,
+        trace_pages - номера страниц для трассировки Chromium (только вместе с profile),
+        profile_memory - дополнительно включить tracemalloc (замедляет запуск и искажает время этапов).
+        """
         # Используем значения по умолчанию, если не указаны
         if num_browsers is None:
             num_browsers = rules.PARSING_SETTINGS["default_num_browsers"]
         if pages_per_browser is None:
             pages_per_browser = rules.PARSING_SETTINGS["default_pages_per_browser"]
+        if enrich is None:
+            enrich = rules.CRAWLER_SETTINGS["enabled"]
             
         # Проверяем ограничения безопасности
         if num_browsers > rules.SECURITY["max_concurrent_browsers"]:
@@ -313,56 +353,79 @@ class ParallelSimpleParser:
             # Корректируем количество страниц на браузер
             pages_per_browser = min(pages_per_browser, rules.SECURITY["max_total_pages"] // num_browsers)
             
-        start_time = time.time()
-        logging.info("=" * 50)
-        logging.info(f"НАЧАЛО ПАРСИНГА: {self.query}")
-        logging.info(f"Запуск парсера с {num_browsers} браузерами, по {pages_per_browser} страниц на браузер")
-        logging.info(f"Общее количество страниц для обработки: {num_browsers * pages_per_browser}")
-        logging.info("=" * 50)
+        self.expected_pages = set(range(1, num_browsers * pages_per_browser + 1))
+        self.completed_pages = set()
         
-        # Создаем пул потоков
-        with ThreadPoolExecutor(max_workers=num_browsers) as executor:
-            futures = []
+        if profile:
+            self.profiler = RunProfiler(self.query, trace_pages, profile_memory)
+            self.profiler.start()
             
-            # Запускаем потоки
-            for i in range(num_browsers):
-                start_page = i * pages_per_browser + 1
-                end_page = (i + 1) * pages_per_browser
+        try:
+            start_time = time.time()
+            logging.info("=" * 50)
+            logging.info(f"НАЧАЛО ПАРСИНГА: {self.query}")
+            logging.info(f"Запуск парсера с {num_browsers} браузерами, по {pages_per_browser} страниц на браузер")
+            logging.info(f"Общее количество страниц для обработки: {num_browsers * pages_per_browser}")
+            logging.info("=" * 50)
+        
+            # Создаем пул потоков
+            with self.profile_phase('parsing'), ThreadPoolExecutor(max_workers=num_browsers, thread_name_prefix='browser') as executor:
+                futures = []
+            
+                # Запускаем потоки
+                for i in range(num_browsers):
+                    start_page = i * pages_per_browser + 1
+                    end_page = (i + 1) * pages_per_browser
                 
-                logging.info(f"Запуск браузера {i+1}/{num_browsers} для обработки страниц {start_page}-{end_page}")
+                    logging.info(f"Запуск браузера {i+1}/{num_browsers} для обработки страниц {start_page}-{end_page}")
                 
-                future = executor.submit(
-                    self.worker,
-                    i,
-                    start_page,
-                    end_page
-                )
-                futures.append(future)
+                    future = executor.submit(
+                        self.worker,
+                        i,
+                        start_page,
+                        end_page
+                    )
+                    futures.append(future)
             
-            # Ожидаем завершения всех потоков
-            for future in futures:
-                try:
-                    future.result()
-                except Exception as e:
-                    logging.error(f"Ошибка при выполнении потока: {str(e)}")
+                # Ожидаем завершения всех потоков
+                for future in futures:
+                    try:
+                        future.result()
+                    except Exception as e:
+                        logging.error(f"Ошибка при выполнении потока: {str(e)}")
         
-        # Сохранение результатов
-        self.save_results()
-        self.save_to_database()
+            if self.profiler:
+                self.profiler.snapshot('parsing')
+            
+            # Сохранение результатов
+            self.results.sort(key=lambda result: result['position'])
+            with self.profile_phase('save_results'):
+                self.save_results()
+            with self.profile_phase('save_to_database'):
+                self.save_to_database()
+        
+            duration = time.time() - start_time
+            logging.info("=" * 50)
+            logging.info("ИТОГИ РАБОТЫ ПАРСЕРА:")
+            logging.info(f"Ключевое слово: {self.query}")
+            logging.info(f"Время выполнения: {duration:.2f} секунд")
+            logging.info(f"Количество запущенных браузеров: {num_browsers}")
+            logging.info(f"Страниц обработано на браузер: {pages_per_browser}")
+            logging.info(f"Всего обработано страниц: {num_browsers * pages_per_browser}")
+            logging.info(f"Найдено результатов: {len(self.results)}")
+            logging.info(f"Средняя скорость: {len(self.results)/duration:.2f} результатов в секунду")
+            logging.info("=" * 50)
+            print(f"\nНайдено результатов: {len(self.results)}")
+            print(f"Время выполнения: {duration:.2f} секунд")
         
-        duration = time.time() - start_time
-        logging.info("=" * 50)
-        logging.info("ИТОГИ РАБОТЫ ПАРСЕРА:")
-        logging.info(f"Ключевое слово: {self.query}")
-        logging.info(f"Время выполнения: {duration:.2f} секунд")
-        logging.info(f"Количество запущенных браузеров: {num_browsers}")
-        logging.info(f"Страниц обработано на браузер: {pages_per_browser}")
-        logging.info(f"Всего обработано страниц: {num_browsers * pages_per_browser}")
-        logging.info(f"Найдено результатов: {len(self.results)}")
-        logging.info(f"Средняя скорость: {len(self.results)/duration:.2f} результатов в секунду")
-        logging.info("=" * 50)
-        print(f"\nНайдено результатов: {len(self.results)}")
-        print(f"Время выполнения: {duration:.2f} секунд")
+            # Обогащение контактами поставщиков (после итогов парсинга, чтобы не искажать статистику)
+            if enrich:
+                with self.profile_phase('enrichment'):
+                    self.enrich_suppliers()
+        finally:
+            if self.profiler:
+                self.profiler.finish()
+                self.profiler = None
 
     def save_results(self):
         """Сохранение результатов в JSON файл"""
@@ -378,9 +441,32 @@ class ParallelSimpleParser:
         logging.info(f"Результаты сохранены в файл: {filename}")
 
 if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Параллельный парсер Google Search")
+    arg_parser.add_argument("query", nargs="?", default="кирпич", help="Поисковый запрос")
+    arg_parser.add_argument("--browsers", "-b", type=int, default=2, help="Количество браузеров")
+    arg_parser.add_argument("--pages", "-p", type=int, default=5, help="Количество страниц на браузер")
+    arg_parser.add_argument("--no-enrich", action="store_true", help="Не запускать обогащение данных поставщиков")
+    arg_parser.add_argument("--profile", action="store_true", help="Сохранить профиль запуска в директорию profiles/")
+    arg_parser.add_argument("--trace-pages", type=lambda value: [int(page) for page in value.split(',')],
+                            help="Номера страниц для трассировки Chromium через запятую (вместе с --profile)")
+    arg_parser.add_argument("--profile-memory", action="store_true",
+                            help="Включить tracemalloc при профилировании (вместе с --profile, время этапов искажается)")
+    args = arg_parser.parse_args()
+    if args.trace_pages and not args.profile:
+        arg_parser.error("--trace-pages работает только вместе с --profile")
+    if args.profile_memory and not args.profile:
+        arg_parser.error("--profile-memory работает только вместе с --profile")
+    
     # Устанавливаем обработчик сигналов для корректного завершения
     signal.signal(signal.SIGINT, signal.SIG_IGN)
     
     # Запускаем парсер
-    parser = ParallelSimpleParser("кирпич")
-    parser.run(num_browsers=2, pages_per_browser=5) 
\ No newline at end of file
+    parser = ParallelSimpleParser(args.query)
+    parser.run(
+        num_browsers=args.browsers,
+        pages_per_browser=args.pages,
+        enrich=False if args.no_enrich else None,
+        profile=args.profile,
+        trace_pages=args.trace_pages,
+        profile_memory=args.profile_memory
+    ) 
\ No newline at end of file
@@ -84,6 +84,33 @@ RESULT_PROCESSING = {
     "results_dir": "results"
 }
 
+# ===== ОБОГАЩЕНИЕ ДАННЫХ ПОСТАВЩИКОВ =====
+CRAWLER_SETTINGS = {
+    "enabled": True,  # Запускать краулер после сохранения в базу данных
+    "max_concurrency": 50,  # Общее количество одновременных запросов
+    "max_per_host": 2,  # Одновременных запросов к одному сайту
+    "host_delay": 1.0,  # Минимальная пауза между запросами к одному сайту (секунды)
+    "max_pages_per_site": 5,
+    "max_page_size": 2097152,  # 2 МБ
+    "request_timeout": 20,  # секунды
+    "robots_cache_ttl": 86400,  # секунды
+    "recrawl_after_days": 7,
+    "extract_workers": 4,  # Процессов для извлечения контактов
+    "batch_size": 200,  # Доменов за один проход
+    "user_agent": "Mozilla/5.0 (compatible; B2BSupplierBot/1.0)",
+    "robots_agent": "B2BSupplierBot",  # Имя бота для групп User-agent в robots.txt
+    "page_keywords": ["contact", "kontakt", "контакт", "price", "prais", "прайс", "about", "o-kompanii", "о-компании", "rekvizit", "реквизит"]
+}
+
+# ===== ПРОФИЛИРОВАНИЕ =====
+PROFILING = {
+    "profiles_dir": "profiles",
+    "sample_interval": 0.005,  # Интервал выборки стеков потоков (секунды)
+    "task_sample_interval": 0.05,  # Интервал выборки задач asyncio (секунды)
+    "tracemalloc_frames": 1,  # Только с --profile-memory
+    "top_allocations": 30
+}
+
 # ===== ЛОГИРОВАНИЕ =====
 LOGGING = {
     "level": "INFO",
@@ -118,6 +145,12 @@ def validate_settings():
     if PARSING_SETTINGS["default_num_browsers"] > SECURITY["max_concurrent_browsers"]:
         raise ValueError(f"Default number of browsers exceeds security limit of {SECURITY['max_concurrent_browsers']}")
     
+    if CRAWLER_SETTINGS["max_per_host"] > 4:
+        raise ValueError("Crawler must not open more than 4 connections per host")
+    
+    if CRAWLER_SETTINGS["host_delay"] < 0.5:
+        raise ValueError("Crawler delay per host must be at least 0.5 seconds")
+    
     return True
 
 # Проверяем настройки при импорте
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+История позиций в поисковой выдаче.
+
+Каждый снимок выдачи хранится как набор изменений относительно предыдущего
+снимка того же запроса: вход в выдачу, выход, смена позиции, смена сниппета.
+URL, заголовки и сниппеты хранятся один раз в справочных таблицах.
+"""
+
+import argparse
+import hashlib
+import logging
+import sqlite3
+from datetime import datetime
+from itertools import groupby
+from urllib.parse import urlsplit
+
+# Типы изменений
+ENTERED = 'entered'
+LEFT = 'left'
+MOVED = 'moved'
+SNIPPET_CHANGED = 'snippet'
+
+# Результатов на странице выдачи (для диапазонов позиций обработанных страниц)
+RESULTS_PER_PAGE = 10
+
+
+def domain_of(url):
+    """Домен результата без www"""
+    netloc = urlsplit(url).netloc.lower()
+    if netloc.startswith('www.'):
+        netloc = netloc[4:]
+    return netloc
+
+
+class RankHistory:
+    def __init__(self, db_path='search_results.db'):
+        self.db_path = db_path
+        self.init_database()
+
+    def init_database(self):
+        """Создание таблиц истории позиций"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS rank_queries (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        query TEXT UNIQUE
+                    )
+                ''')
+
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS rank_urls (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        url TEXT UNIQUE,
+                        domain TEXT
+                    )
+                ''')
+
+                # Заголовки и сниппеты (интернирование по хэшу текста)
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS rank_texts (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        hash TEXT UNIQUE,
+                        text TEXT
+                    )
+                ''')
+
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS rank_snapshots (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        query_id INTEGER,
+                        taken_at DATETIME,
+                        result_count INTEGER,
+                        partial INTEGER DEFAULT 0
+                    )
+                ''')
+
+                cursor.execute('PRAGMA table_info(rank_snapshots)')
+                if 'partial' not in [row[1] for row in cursor.fetchall()]:
+                    cursor.execute('ALTER TABLE rank_snapshots ADD COLUMN partial INTEGER DEFAULT 0')
+
+                # Изменения снимка относительно предыдущего снимка запроса.
+                # Каждая строка содержит полное текущее состояние URL,
+                # поэтому состояние на любую дату - это последняя строка по URL.
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS rank_changes (
+                        snapshot_id INTEGER,
+                        query_id INTEGER,
+                        url_id INTEGER,
+                        kind TEXT,
+                        position INTEGER,
+                        prev_position INTEGER,
+                        title_id INTEGER,
+                        snippet_id INTEGER
+                    )
+                ''')
+
+                # Последний снимок каждого запроса (для вычисления изменений без чтения истории)
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS rank_current (
+                        query_id INTEGER,
+                        url_id INTEGER,
+                        position INTEGER,
+                        title_id INTEGER,
+                        snippet_id INTEGER,
+                        PRIMARY KEY (query_id, url_id)
+                    )
+                ''')
+
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_rank_urls_domain ON rank_urls(domain)')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_rank_snapshots_query ON rank_snapshots(query_id, taken_at)')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_rank_changes_url ON rank_changes(query_id, url_id, snapshot_id)')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_rank_changes_snapshot ON rank_changes(snapshot_id)')
+
+                conn.commit()
+        except Exception as e:
+            logging.error(f"Ошибка при инициализации истории позиций: {str(e)}")
+            raise
+
+    def _query_id(self, cursor, query, create=False):
+        if create:
+            cursor.execute('INSERT OR IGNORE INTO rank_queries (query) VALUES (?)', (query,))
+        cursor.execute('SELECT id FROM rank_queries WHERE query = ?', (query,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    def _intern_urls(self, cursor, urls):
+        cursor.executemany(
+            'INSERT OR IGNORE INTO rank_urls (url, domain) VALUES (?, ?)',
+            [(url, domain_of(url)) for url in urls]
+        )
+        ids = {}
+        for url in urls:
+            cursor.execute('SELECT id FROM rank_urls WHERE url = ?', (url,))
+            ids[url] = cursor.fetchone()[0]
+        return ids
+
+    def _intern_texts(self, cursor, texts):
+        hashes = {text: hashlib.sha1(text.encode('utf-8')).hexdigest() for text in texts}
+        cursor.executemany(
+            'INSERT OR IGNORE INTO rank_texts (hash, text) VALUES (?, ?)',
+            [(digest, text) for text, digest in hashes.items()]
+        )
+        ids = {}
+        for text, digest in hashes.items():
+            cursor.execute('SELECT id FROM rank_texts WHERE hash = ?', (digest,))
+            ids[text] = cursor.fetchone()[0]
+        return ids
+
+    def record(self, query, results, taken_at=None, pages=None):
+        """
+        Сохранение снимка выдачи.
+        results - список словарей с ключами title, url, snippet, position
+        (абсолютная позиция в выдаче). pages - номера обработанных страниц при
+        неполном запуске: изменения считаются только в их диапазонах позиций,
+        остальные результаты предыдущего снимка переносятся без изменений.
+        Возвращает количество записанных изменений.
+        """
+        if taken_at is None:
+            taken_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+        # Один URL может попасть в выдачу несколько раз - оставляем лучшую позицию
+        best = {}
+        for result in sorted(results, key=lambda r: r['position']):
+            best.setdefault(result['url'], result)
+
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                query_id = self._query_id(cursor, query, create=True)
+                url_ids = self._intern_urls(cursor, list(best))
+                text_ids = self._intern_texts(
+                    cursor, {r['title'] for r in best.values()} | {r['snippet'] for r in best.values()}
+                )
+
+                cursor.execute(
+                    'SELECT url_id, position, title_id, snippet_id FROM rank_current WHERE query_id = ?',
+                    (query_id,)
+                )
+                previous = {row[0]: row[1:] for row in cursor.fetchall()}
+
+                current = {}
+                for url, result in best.items():
+                    current[url_ids[url]] = (
+                        result['position'], text_ids[result['title']], text_ids[result['snippet']]
+                    )
+
+                # Результаты с необработанных страниц переносятся из предыдущего снимка
+                carried = {}
+                if pages is not None:
+                    for url_id, state in previous.items():
+                        if url_id not in current and (state[0] - 1) // RESULTS_PER_PAGE + 1 not in pages:
+                            carried[url_id] = state
+
+                changes = []
+                for url_id, (position, title_id, snippet_id) in current.items():
+                    old = previous.get(url_id)
+                    if old is None:
+                        changes.append((url_id, ENTERED, position, None, title_id, snippet_id))
+                    elif old[0] != position:
+                        changes.append((url_id, MOVED, position, old[0], title_id, snippet_id))
+                    elif old[1:] != (title_id, snippet_id):
+                        changes.append((url_id, SNIPPET_CHANGED, position, old[0], title_id, snippet_id))
+                for url_id, (position, title_id, snippet_id) in previous.items():
+                    if url_id not in current and url_id not in carried:
+                        changes.append((url_id, LEFT, None, position, title_id, snippet_id))
+
+                state = {**carried, **current}
+                cursor.execute(
+                    'INSERT INTO rank_snapshots (query_id, taken_at, result_count, partial) VALUES (?, ?, ?, ?)',
+                    (query_id, taken_at, len(state), int(pages is not None))
+                )
+                snapshot_id = cursor.lastrowid
+
+                cursor.executemany(
+                    'INSERT INTO rank_changes (snapshot_id, query_id, url_id, kind, position, prev_position, '
+                    'title_id, snippet_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    [(snapshot_id, query_id, *change) for change in changes]
+                )
+
+                cursor.execute('DELETE FROM rank_current WHERE query_id = ?', (query_id,))
+                cursor.executemany(
+                    'INSERT INTO rank_current (query_id, url_id, position, title_id, snippet_id) VALUES (?, ?, ?, ?, ?)',
+                    [(query_id, url_id, *row) for url_id, row in state.items()]
+                )
+
+                conn.commit()
+                logging.info(
+                    f"Снимок выдачи для запроса '{query}': {len(current)} результатов, "
+                    f"{len(carried)} перенесено из предыдущего снимка, {len(changes)} изменений"
+                )
+                return len(changes)
+
+        except Exception as e:
+            logging.error(f"Ошибка при сохранении истории позиций: {str(e)}")
+            raise
+
+    def domain_history(self, query, domain):
+        """
+        Позиция домена в выдаче запроса по времени.
+        Возвращает список (taken_at, position) для снимков, в которых позиция
+        домена изменилась; position = None, если домен выпал из выдачи.
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            query_id = self._query_id(cursor, query)
+            if query_id is None:
+                return []
+
+            cursor.execute('''
+                SELECT s.id, s.taken_at, c.url_id, c.position
+                FROM rank_changes c
+                JOIN rank_snapshots s ON s.id = c.snapshot_id
+                WHERE c.query_id = ? AND c.url_id IN (SELECT id FROM rank_urls WHERE domain = ?)
+                ORDER BY c.snapshot_id
+            ''', (query_id, domain_of(domain if '//' in domain else f"//{domain}")))
+
+            # Сначала применяются все изменения снимка, затем лучшая позиция
+            # сравнивается с последней записанной
+            history = []
+            positions = {}
+            for (_, taken_at), rows in groupby(cursor.fetchall(), key=lambda row: row[:2]):
+                for _, _, url_id, position in rows:
+                    if position is None:
+                        positions.pop(url_id, None)
+                    else:
+                        positions[url_id] = position
+                best = min(positions.values()) if positions else None
+                if not history or history[-1][1] != best:
+                    history.append((taken_at, best))
+            return history
+
+    def positions_at(self, cursor, query_id, taken_at):
+        """Состояние выдачи запроса на момент времени: {url_id: position}"""
+        cursor.execute(
+            'SELECT MAX(id) FROM rank_snapshots WHERE query_id = ? AND taken_at <= ?',
+            (query_id, taken_at)
+        )
+        snapshot_id = cursor.fetchone()[0]
+        if snapshot_id is None:
+            return {}
+
+        cursor.execute('''
+            SELECT c.url_id, c.position
+            FROM rank_changes c
+            JOIN (
+                SELECT url_id, MAX(snapshot_id) AS snapshot_id
+                FROM rank_changes
+                WHERE query_id = ? AND snapshot_id <= ?
+                GROUP BY url_id
+            ) last ON last.url_id = c.url_id AND last.snapshot_id = c.snapshot_id
+            WHERE c.query_id = ? AND c.position IS NOT NULL
+        ''', (query_id, snapshot_id, query_id))
+        return dict(cursor.fetchall())
+
+    def biggest_movers(self, query, since, until=None, limit=20):
+        """
+        Результаты с наибольшим изменением позиции между двумя датами.
+        Вышедшие из выдачи и новые результаты считаются стоящими на позиции
+        сразу за последним результатом.
+        """
+        if until is None:
+            until = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            query_id = self._query_id(cursor, query)
+            if query_id is None:
+                return []
+
+            before = self.positions_at(cursor, query_id, since)
+            after = self.positions_at(cursor, query_id, until)
+            depth = max([*before.values(), *after.values(), 0]) + 1
+
+            movers = []
+            for url_id in before.keys() | after.keys():
+                old, new = before.get(url_id), after.get(url_id)
+                delta = (old or depth) - (new or depth)
+                if delta:
+                    movers.append((url_id, old, new, delta))
+            movers.sort(key=lambda m: abs(m[3]), reverse=True)
+            movers = movers[:limit]
+
+            urls = {}
+            if movers:
+                placeholders = ','.join('?' * len(movers))
+                cursor.execute(
+                    f'SELECT id, url FROM rank_urls WHERE id IN ({placeholders})',
+                    [m[0] for m in movers]
+                )
+                urls = dict(cursor.fetchall())
+
+            return [
+                {'url': urls[url_id], 'old_position': old, 'new_position': new, 'delta': delta}
+                for url_id, old, new, delta in movers
+            ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="История позиций в поисковой выдаче")
+    parser.add_argument("--query", "-q", required=True, help="Поисковый запрос")
+    parser.add_argument("--domain", "-d", help="Показать историю позиций домена")
+    parser.add_argument("--since", help="Показать наибольшие изменения позиций с даты (YYYY-MM-DD)")
+    parser.add_argument("--until", help="Конечная дата для --since (по умолчанию - сейчас)")
+    parser.add_argument("--limit", type=int, default=20, help="Количество результатов для --since")
+    parser.add_argument("--db", default="search_results.db", help="Путь к базе данных")
+
+    args = parser.parse_args()
+    history = RankHistory(args.db)
+
+    if args.domain:
+        for taken_at, position in history.domain_history(args.query, args.domain):
+            print(f"{taken_at}  {position if position is not None else '-'}")
+    elif args.since:
+        for mover in history.biggest_movers(args.query, args.since, args.until, args.limit):
+            old = mover['old_position'] if mover['old_position'] is not None else '-'
+            new = mover['new_position'] if mover['new_position'] is not None else '-'
+            print(f"{mover['delta']:+4d}  {old:>3} -> {new:<3}  {mover['url']}")
+    else:
+        parser.print_help()
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Профилирование запуска парсера.
+
+Собирает в одну директорию на запуск:
+- wall_active.folded / wall_top.txt - выборка стеков всех потоков по реальному времени без
+  ожидания ввода-вывода и блокировок (формат для flamegraph.pl и speedscope)
+- asyncio_tasks.txt - выборка точек ожидания задач asyncio и задержки цикла событий
+- tracemalloc_<этап>.dump / .txt - снимки памяти и основные места выделения (только с profile_memory)
+- trace_page_<N>.json - трассировка Chromium для выбранных страниц
+- summary.json - длительности этапов и распределение времени по категориям
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+import parser_rules as rules
+
+# Функции блокирующего ожидания (последний кадр стека): время в них не является работой потока
+IDLE_FUNCTIONS = ('select', 'poll', 'wait', 'readinto', 'recv', 'recv_into', 'recv_bytes', 'accept', 'acquire')
+
+# Функции, работающие с базой данных. Вызовы sqlite3 выполняются в C и не дают
+# собственных кадров, поэтому время запросов попадает в эти функции.
+DATABASE_FUNCTIONS = {
+    'parallel_simple_parser': ('init_database', 'save_to_database'),
+    'rank_history': ('init_database', 'record', 'domain_history', 'positions_at', 'biggest_movers'),
+    'supplier_crawler': ('init_database', 'queue_new_domains', 'load_pending_domains', 'load_validators', 'save_domain'),
+}
+# Парсер запускается как скрипт, его модуль в стеке - __main__
+MAIN_MODULES = {'__main__': 'parallel_simple_parser'}
+
+# Категории времени для сравнения версий: проверяются по порядку, первая подходящая побеждает.
+# Извлечение контактов краулером (extract_contacts) выполняется в дочерних процессах
+# и в выборку не попадает, поэтому 'extraction' - это только разбор выдачи в потоках браузеров.
+CATEGORIES = [
+    ('logging', lambda frames: any(module.startswith('logging') for module, _ in frames)),
+    ('database', lambda frames: any(name in DATABASE_FUNCTIONS.get(MAIN_MODULES.get(module, module), ())
+                                    for module, name in frames)),
+    ('idle', lambda frames: frames[-1][0] in ('selectors', 'threading', 'queue') or
+                            frames[-1][1] in IDLE_FUNCTIONS),
+    ('extraction', lambda frames: any(name == 'process_page' for _, name in frames)),
+]
+
+
+def frame_label(frame):
+    code = frame.f_code
+    module = frame.f_globals.get('__name__', '?')
+    return f"{code.co_name} ({module}:{code.co_firstlineno})"
+
+
+def await_location(task):
+    """Самая глубокая точка ожидания задачи"""
+    coro = task.get_coro()
+    frame = None
+    while coro is not None:
+        frame = getattr(coro, 'cr_frame', None) or getattr(coro, 'gi_frame', None) or frame
+        coro = getattr(coro, 'cr_await', None) or getattr(coro, 'gi_await', None)
+    if frame is None:
+        return 'unknown'
+    return f"{frame.f_code.co_name} ({frame.f_globals.get('__name__', '?')}:{frame.f_lineno})"
+
+
+class RunProfiler:
+    def __init__(self, query, trace_pages=None, profile_memory=False):
+        self.settings = rules.PROFILING
+        self.profile_memory = profile_memory
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.output_dir = os.path.join(self.settings["profiles_dir"], f"profile_{self.query_slug(query)}_{timestamp}")
+        self.trace_pages = set(trace_pages or [])
+
+        self.lock = threading.Lock()
+        self.stacks = Counter()
+        self.await_time = Counter()
+        self.loop_lag = {'samples': 0, 'total': 0.0, 'max': 0.0}
+        self.phases = Counter()
+        self.snapshots = []
+        self._stop = threading.Event()
+        self._sampler = None
+        self.started_at = None
+
+    @staticmethod
+    def query_slug(query):
+        return ''.join(c if c.isalnum() else '_' for c in query)[:50]
+
+    def start(self):
+        """Запуск сбора профиля"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        # tracemalloc замедляет код с большим количеством выделений памяти и искажает
+        # распределение времени, поэтому включается только отдельно
+        if self.profile_memory:
+            tracemalloc.start(self.settings["tracemalloc_frames"])
+        self.started_at = time.perf_counter()
+        self._sampler = threading.Thread(target=self.sample_stacks, name='profiler', daemon=True)
+        self._sampler.start()
+        logging.info(f"Профилирование включено, результаты: {self.output_dir}")
+
+    def sample_stacks(self):
+        """Выборка стеков всех потоков с заданным интервалом"""
+        own_id = threading.get_ident()
+        last = time.perf_counter()
+        while not self._stop.wait(self.settings["sample_interval"]):
+            # Вес выборки - фактическое время с прошлой выборки (поток профилировщика тоже ждет GIL)
+            now = time.perf_counter()
+            elapsed, last = now - last, now
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append((frame.f_globals.get('__name__', '?'), frame.f_code.co_name, frame_label(frame)))
+                    frame = frame.f_back
+                stack.reverse()
+                self.stacks[(names.get(thread_id, str(thread_id)), tuple(stack))] += elapsed
+
+    async def sample_tasks(self, label):
+        """Выборка задач asyncio текущего цикла событий (запускается в каждом потоке браузера)"""
+        interval = self.settings["task_sample_interval"]
+        loop = asyncio.get_running_loop()
+        current = asyncio.current_task()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(interval)
+            elapsed = loop.time() - started
+            lag = max(0.0, elapsed - interval)
+            locations = [
+                f"{label}: {task.get_coro().__qualname__} <- {await_location(task)}"
+                for task in asyncio.all_tasks() if task is not current and not task.done()
+            ]
+            with self.lock:
+                self.loop_lag['samples'] += 1
+                self.loop_lag['total'] += lag
+                self.loop_lag['max'] = max(self.loop_lag['max'], lag)
+                for location in locations:
+                    self.await_time[location] += elapsed
+
+    @contextmanager
+    def phase(self, name):
+        """Замер длительности этапа запуска"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.phases[name] += time.perf_counter() - started
+
+    def should_trace(self, page_num):
+        return page_num in self.trace_pages
+
+    def trace_path(self, page_num):
+        return os.path.join(self.output_dir, f"trace_page_{page_num}.json")
+
+    def snapshot(self, label):
+        """Снимок tracemalloc после этапа"""
+        if not tracemalloc.is_tracing():
+            return
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+        snapshot.dump(os.path.join(self.output_dir, f"tracemalloc_{label}.dump"))
+        current, peak = tracemalloc.get_traced_memory()
+
+        with open(os.path.join(self.output_dir, f"tracemalloc_{label}.txt"), 'w', encoding='utf-8') as f:
+            f.write(f"Текущая память: {current / 1024:.1f} КБ, пик: {peak / 1024:.1f} КБ\n\n")
+            f.write("Основные места выделения памяти:\n")
+            for stat in snapshot.statistics('lineno')[:self.settings["top_allocations"]]:
+                f.write(f"{stat}\n")
+            f.write("\nОсновные стеки выделения памяти:\n")
+            for stat in snapshot.statistics('traceback')[:10]:
+                f.write(f"\n{stat}\n")
+                for line in stat.traceback.format():
+                    f.write(f"{line}\n")
+        self.snapshots.append({'label': label, 'current_kb': current / 1024, 'peak_kb': peak / 1024})
+
+    def categorize(self, stack):
+        frames = [(module, name) for module, name, _ in stack]
+        if not frames:
+            return 'other'
+        for category, matches in CATEGORIES:
+            if matches(frames):
+                return category
+        return 'other'
+
+    def finish(self):
+        """Остановка сбора и сохранение результатов"""
+        self._stop.set()
+        if self._sampler:
+            self._sampler.join()
+        self.snapshot('final')
+        tracemalloc.stop()
+        duration = time.perf_counter() - self.started_at
+
+        own_time, total_time, categories = Counter(), Counter(), Counter()
+        active_stacks = []
+        for (thread_name, stack), seconds in self.stacks.most_common():
+            category = self.categorize(stack)
+            categories[category] += seconds
+            if category == 'idle':
+                continue
+            active_stacks.append((thread_name, stack, seconds))
+            if stack:
+                own_time[stack[-1][2]] += seconds
+            for label in {label for _, _, label in stack}:
+                total_time[label] += seconds
+
+        # Свернутые стеки для flamegraph.pl / speedscope (вес - миллисекунды реального времени).
+        # Выборка не отличает работу процессора от ожидания GIL, ожидание ввода-вывода исключено
+        with open(os.path.join(self.output_dir, 'wall_active.folded'), 'w', encoding='utf-8') as f:
+            for thread_name, stack, seconds in active_stacks:
+                labels = [thread_name] + [label for _, _, label in stack]
+                f.write(f"{';'.join(labels)} {max(1, round(seconds * 1000))}\n")
+
+        with open(os.path.join(self.output_dir, 'wall_top.txt'), 'w', encoding='utf-8') as f:
+            f.write(f"Интервал выборки {self.settings['sample_interval'] * 1000:.1f} мс, реальное время суммируется по всем потокам\n")
+            f.write(f"Ожидание ввода-вывода и блокировок (не показано): {categories['idle']:.2f}с\n\n")
+            f.write(f"{'собств.':>10} {'общее':>10}  функция\n")
+            for label, seconds in own_time.most_common(50):
+                f.write(f"{seconds:>9.2f}с {total_time[label]:>9.2f}с  {label}\n")
+
+        with open(os.path.join(self.output_dir, 'asyncio_tasks.txt'), 'w', encoding='utf-8') as f:
+            lag = self.loop_lag
+            average = lag['total'] / lag['samples'] if lag['samples'] else 0.0
+            f.write(f"Задержка цикла событий: средняя {average * 1000:.1f} мс, максимальная {lag['max'] * 1000:.1f} мс\n\n")
+            f.write("Оценка времени ожидания по задачам и точкам ожидания:\n")
+            for location, seconds in self.await_time.most_common(100):
+                f.write(f"{seconds:>9.2f}с  {location}\n")
+
+        summary = {
+            'duration': round(duration, 3),
+            'phases': {name: round(seconds, 3) for name, seconds in self.phases.items()},
+            'tracemalloc_enabled': self.profile_memory,
+            'thread_wall_time_by_category': {
+                name: round(seconds, 3) for name, seconds in categories.most_common()
+            },
+            'loop_lag_max_ms': round(self.loop_lag['max'] * 1000, 1),
+            'tracemalloc': self.snapshots,
+            'traced_pages': sorted(self.trace_pages),
+        }
+        with open(os.path.join(self.output_dir, 'summary.json'), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+        logging.info(f"Результаты профилирования сохранены в директорию: {self.output_dir}")
@@ -0,0 +1,535 @@
+#!/usr/bin/env python3
+"""
+Краулер для обогащения данных поставщиков.
+
+Читает новые уникальные домены из истории позиций (rank_urls) и из строк
+search_results, сохраненных прежними версиями парсера, загружает
+ограниченное количество страниц с каждого сайта и извлекает контакты
+(email, телефоны, ИНН, ссылки на прайс-листы) в таблицу supplier_contacts.
+"""
+
+import asyncio
+import aiohttp
+import time
+import re
+import logging
+import sqlite3
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlsplit, unquote
+from urllib.robotparser import RobotFileParser
+import parser_rules as rules
+
+EMAIL_RE = re.compile(r'[A-Za-z0-9._%+\-]+@[A-Za-z0-9.\-]+\.[A-Za-z]{2,}')
+PHONE_RE = re.compile(r'(?<!\d)(?:\+7|8)[\s\-(]*\d{3}[\s\-)]*\d{3}[\s\-]*\d{2}[\s\-]*\d{2}(?!\d)')
+INN_RE = re.compile(r'ИНН[\s:№]*(\d{12}|\d{10})(?!\d)', re.IGNORECASE)
+# Таблицы с URL найденных сайтов: rank_urls - история позиций,
+# search_results - полные строки выдачи, которые сохраняли прежние версии парсера
+URL_SOURCES = ('rank_urls', 'search_results')
+PRICE_LINK_RE = re.compile(r'(price|prais|прайс)', re.IGNORECASE)
+PRICE_FILE_EXTENSIONS = ('.xls', '.xlsx', '.csv', '.pdf', '.doc', '.docx', '.zip')
+META_CHARSET_RE = re.compile(rb'''<meta[^>]+charset=["']?([A-Za-z0-9_\-]+)''', re.IGNORECASE)
+IGNORED_EMAIL_SUFFIXES = ('.png', '.jpg', '.jpeg', '.gif', '.svg', '.webp', '.js', '.css')
+
+
+class _PageParser(HTMLParser):
+    """Сбор ссылок и видимого текста страницы"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.links = []
+        self.text = []
+        self._current_href = None
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ('script', 'style', 'noscript'):
+            self._skip_depth += 1
+        elif tag == 'a':
+            self._current_href = dict(attrs).get('href')
+            if self._current_href:
+                self.links.append([self._current_href, ''])
+
+    def handle_endtag(self, tag):
+        if tag in ('script', 'style', 'noscript') and self._skip_depth:
+            self._skip_depth -= 1
+        elif tag == 'a':
+            self._current_href = None
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        self.text.append(data)
+        if self._current_href and self.links:
+            self.links[-1][1] += data
+
+
+def domain_of(url):
+    """Ключ домена для таблицы обогащения"""
+    netloc = urlsplit(url).netloc.lower()
+    if netloc.startswith('www.'):
+        netloc = netloc[4:]
+    return netloc
+
+
+def decode_page(raw, declared=None):
+    """
+    Декодирование страницы: кодировка из заголовка Content-Type, затем из <meta>
+    в начале страницы, затем utf-8 и windows-1251 (типична для российских сайтов).
+    """
+    match = META_CHARSET_RE.search(raw[:4096])
+    for charset in (declared, match.group(1).decode('ascii') if match else None):
+        if charset:
+            try:
+                return raw.decode(charset, errors='replace')
+            except LookupError:
+                continue
+
+    try:
+        return raw.decode('utf-8')
+    except UnicodeDecodeError as e:
+        # Страница могла быть обрезана по max_page_size посреди символа
+        if e.start >= len(raw) - 3:
+            return raw.decode('utf-8', errors='replace')
+        return raw.decode('cp1251', errors='replace')
+
+
+def normalize_phone(raw):
+    """Приведение телефона к формату +7XXXXXXXXXX"""
+    digits = re.sub(r'\D', '', raw)
+    if len(digits) != 11:
+        return None
+    return '+7' + digits[1:]
+
+
+def is_valid_inn(inn):
+    """Проверка контрольной суммы ИНН (10 или 12 цифр)"""
+    digits = [int(c) for c in inn]
+
+    def checksum(coefficients):
+        return sum(c * d for c, d in zip(coefficients, digits)) % 11 % 10
+
+    if len(digits) == 10:
+        return checksum([2, 4, 10, 3, 5, 9, 4, 6, 8]) == digits[9]
+    if len(digits) == 12:
+        return (checksum([7, 2, 4, 10, 3, 5, 9, 4, 6, 8]) == digits[10] and
+                checksum([3, 7, 2, 4, 10, 3, 5, 9, 4, 6, 8]) == digits[11])
+    return False
+
+
+def extract_contacts(html, page_url, keywords):
+    """
+    Извлечение контактов и ссылок со страницы.
+    Выполняется в пуле процессов, поэтому функция находится на уровне модуля.
+    """
+    parser = _PageParser()
+    try:
+        parser.feed(html)
+        parser.close()
+    except Exception:
+        pass
+    text = ' '.join(parser.text)
+
+    emails, phones, inns, price_links, next_links = set(), set(), set(), set(), []
+    page_domain = domain_of(page_url)
+
+    for href, anchor in parser.links:
+        href = href.strip()
+        lowered = href.lower()
+        if lowered.startswith('mailto:'):
+            emails.add(unquote(href[7:].split('?')[0]).strip().lower())
+            continue
+        if lowered.startswith('tel:'):
+            phone = normalize_phone(href[4:])
+            if phone:
+                phones.add(phone)
+            continue
+        if lowered.startswith(('javascript:', '#')):
+            continue
+
+        absolute = urljoin(page_url, href).split('#')[0]
+        parts = urlsplit(absolute)
+        if parts.scheme not in ('http', 'https'):
+            continue
+        if parts.path.lower().endswith(PRICE_FILE_EXTENSIONS):
+            if PRICE_LINK_RE.search(unquote(absolute)) or PRICE_LINK_RE.search(anchor):
+                price_links.add(absolute)
+            continue
+        if domain_of(absolute) == page_domain:
+            target = (unquote(absolute) + ' ' + anchor).lower()
+            if any(keyword in target for keyword in keywords):
+                next_links.append(absolute)
+
+    for email in EMAIL_RE.findall(text):
+        email = email.lower().strip('.')
+        if not email.endswith(IGNORED_EMAIL_SUFFIXES):
+            emails.add(email)
+
+    for raw in PHONE_RE.findall(text):
+        phone = normalize_phone(raw)
+        if phone:
+            phones.add(phone)
+
+    for inn in INN_RE.findall(text):
+        if is_valid_inn(inn):
+            inns.add(inn)
+
+    return {
+        'email': sorted(e for e in emails if EMAIL_RE.fullmatch(e)),
+        'phone': sorted(phones),
+        'inn': sorted(inns),
+        'price_list': sorted(price_links),
+        'links': list(dict.fromkeys(next_links))
+    }
+
+
+class SupplierCrawler:
+    def __init__(self, db_path='search_results.db', settings=None, profiler=None):
+        self.db_path = db_path
+        self.profiler = profiler
+        self.settings = dict(rules.CRAWLER_SETTINGS)
+        if settings:
+            self.settings.update(settings)
+
+        self.robots_cache = {}
+        self.host_semaphores = {}
+        self.host_next_time = {}
+        self.stats = {'pages': 0, 'not_modified': 0, 'errors': 0, 'contacts': 0, 'domains': 0}
+
+        self.init_database()
+
+    def init_database(self):
+        """Создание таблиц обогащения"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+
+                # Состояние обхода доменов (для возобновления)
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS crawl_domains (
+                        domain TEXT PRIMARY KEY,
+                        start_url TEXT,
+                        status TEXT DEFAULT 'pending',
+                        pages_fetched INTEGER DEFAULT 0,
+                        last_error TEXT,
+                        last_crawled DATETIME
+                    )
+                ''')
+
+                # Последний обработанный id таблицы-источника URL
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS crawl_state (
+                        source TEXT PRIMARY KEY,
+                        last_id INTEGER
+                    )
+                ''')
+
+                # Заголовки для условных GET-запросов
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS crawl_pages (
+                        url TEXT PRIMARY KEY,
+                        domain TEXT,
+                        status_code INTEGER,
+                        etag TEXT,
+                        last_modified TEXT,
+                        fetched_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+
+                # Найденные контакты поставщиков
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS supplier_contacts (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        domain TEXT,
+                        kind TEXT,
+                        value TEXT,
+                        source_url TEXT,
+                        found_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                        UNIQUE(domain, kind, value)
+                    )
+                ''')
+
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_crawl_status ON crawl_domains(status)')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_crawl_pages_domain ON crawl_pages(domain)')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_contacts_kind_value ON supplier_contacts(kind, value)')
+
+                conn.commit()
+        except Exception as e:
+            logging.error(f"Ошибка при инициализации таблиц обогащения: {str(e)}")
+            raise
+
+    def queue_new_domains(self):
+        """Добавление в очередь обхода доменов из строк, добавленных в таблицы-источники с прошлого запуска"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+            tables = {row[0] for row in cursor.fetchall()}
+
+            domains = {}
+            marks = []
+            for source in URL_SOURCES:
+                if source not in tables:
+                    continue
+                cursor.execute('SELECT last_id FROM crawl_state WHERE source = ?', (source,))
+                row = cursor.fetchone()
+                last_id = row[0] if row else 0
+
+                cursor.execute(f'SELECT id, url FROM {source} WHERE id > ? ORDER BY id', (last_id,))
+                for row_id, url in cursor.fetchall():
+                    last_id = row_id
+                    if not url or not url.startswith(('http://', 'https://')):
+                        continue
+                    domain = domain_of(url)
+                    if domain and domain not in domains:
+                        parts = urlsplit(url)
+                        domains[domain] = f"{parts.scheme}://{parts.netloc}/"
+                marks.append((source, last_id))
+
+            cursor.executemany(
+                'INSERT OR IGNORE INTO crawl_domains (domain, start_url) VALUES (?, ?)',
+                domains.items()
+            )
+            queued = cursor.rowcount
+            cursor.executemany('INSERT OR REPLACE INTO crawl_state (source, last_id) VALUES (?, ?)', marks)
+
+            # Повторный обход устаревших доменов
+            threshold = datetime.now() - timedelta(days=self.settings["recrawl_after_days"])
+            cursor.execute(
+                "UPDATE crawl_domains SET status = 'pending' WHERE status != 'pending' AND last_crawled <= ?",
+                (threshold.strftime('%Y-%m-%d %H:%M:%S'),)
+            )
+            conn.commit()
+            logging.info(f"Новых доменов в очереди обхода: {queued}, на повторный обход: {cursor.rowcount}")
+
+    def load_pending_domains(self, limit):
+        """Получение очередной порции доменов для обхода"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT domain, start_url FROM crawl_domains WHERE status = 'pending' ORDER BY domain LIMIT ?",
+                (limit,)
+            )
+            return cursor.fetchall()
+
+    def load_validators(self, domain):
+        """ETag и Last-Modified ранее загруженных страниц домена"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                'SELECT url, etag, last_modified FROM crawl_pages WHERE domain = ? AND status_code IN (200, 304)',
+                (domain,)
+            )
+            return {url: (etag, last_modified) for url, etag, last_modified in cursor.fetchall()}
+
+    def save_domain(self, domain, pages, contacts, error=None):
+        """Сохранение результатов обхода домена одной транзакцией"""
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.executemany(
+                'INSERT OR REPLACE INTO crawl_pages (url, domain, status_code, etag, last_modified, fetched_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                [(url, domain, status, etag, last_modified, now) for url, status, etag, last_modified in pages]
+            )
+            cursor.executemany(
+                'INSERT OR IGNORE INTO supplier_contacts (domain, kind, value, source_url) VALUES (?, ?, ?, ?)',
+                [(domain, kind, value, source_url) for kind, value, source_url in contacts]
+            )
+            self.stats['contacts'] += cursor.rowcount
+            cursor.execute(
+                'UPDATE crawl_domains SET status = ?, pages_fetched = ?, last_error = ?, last_crawled = ? WHERE domain = ?',
+                ('failed' if error else 'done', len(pages), error, now, domain)
+            )
+            conn.commit()
+
+    async def wait_for_host(self, host):
+        """Соблюдение минимальной паузы между запросами к одному сайту"""
+        now = time.monotonic()
+        next_time = self.host_next_time.get(host, now)
+        self.host_next_time[host] = max(now, next_time) + self.settings["host_delay"]
+        if next_time > now:
+            await asyncio.sleep(next_time - now)
+
+    async def fetch(self, session, url, validators=None):
+        """Загрузка страницы с ограничением по хосту и условными заголовками"""
+        host = urlsplit(url).netloc.lower()
+        semaphore = self.host_semaphores.setdefault(host, asyncio.Semaphore(self.settings["max_per_host"]))
+
+        headers = {}
+        if validators:
+            etag, last_modified = validators
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+
+        async with semaphore:
+            await self.wait_for_host(host)
+            async with session.get(url, headers=headers, allow_redirects=True) as response:
+                body = None
+                if response.status == 200:
+                    content_type = response.headers.get('Content-Type', '')
+                    if 'html' in content_type or 'text/plain' in content_type:
+                        # content.read(n) возвращает только уже полученные данные, читаем до конца или лимита
+                        chunks, size = [], 0
+                        async for chunk in response.content.iter_chunked(65536):
+                            chunks.append(chunk)
+                            size += len(chunk)
+                            if size >= self.settings["max_page_size"]:
+                                break
+                        raw = b''.join(chunks)[:self.settings["max_page_size"]]
+                        body = decode_page(raw, response.charset)
+                return response.status, response.headers.get('ETag'), response.headers.get('Last-Modified'), body
+
+    async def get_robots(self, session, start_url):
+        """Получение robots.txt с кэшированием по хосту"""
+        parts = urlsplit(start_url)
+        host = parts.netloc.lower()
+        cached = self.robots_cache.get(host)
+        if cached and time.monotonic() - cached[0] < self.settings["robots_cache_ttl"]:
+            return cached[1]
+
+        robots = RobotFileParser()
+        try:
+            status, _, _, body = await self.fetch(session, f"{parts.scheme}://{parts.netloc}/robots.txt")
+            if status == 200 and body is not None:
+                robots.parse(body.splitlines())
+            elif status in (401, 403):
+                robots.disallow_all = True
+            else:
+                robots.allow_all = True
+        except Exception:
+            robots.allow_all = True
+
+        self.robots_cache[host] = (time.monotonic(), robots)
+        return robots
+
+    async def crawl_domain(self, session, pool, domain, start_url):
+        """Обход ограниченного набора страниц одного сайта"""
+        loop = asyncio.get_running_loop()
+        # RobotFileParser сравнивает только часть до первого "/", поэтому передается имя бота, а не User-Agent
+        robots_agent = self.settings["robots_agent"]
+        keywords = self.settings["page_keywords"]
+        max_pages = self.settings["max_pages_per_site"]
+
+        validators = self.load_validators(domain)
+        robots = await self.get_robots(session, start_url)
+
+        # Ранее загруженные страницы проверяются повторно: при ответе 304
+        # ссылки с них не извлекаются заново
+        queue = list(dict.fromkeys([start_url, *validators]))
+        seen = set(queue)
+        pages, contacts = [], []
+        error = None
+
+        while queue and len(pages) < max_pages:
+            batch = queue[:max_pages - len(pages)]
+            queue = queue[len(batch):]
+            batch = [url for url in batch if robots.can_fetch(robots_agent, url)]
+
+            responses = await asyncio.gather(
+                *(self.fetch(session, url, validators.get(url)) for url in batch),
+                return_exceptions=True
+            )
+
+            extractions = []
+            for url, response in zip(batch, responses):
+                if isinstance(response, Exception):
+                    self.stats['errors'] += 1
+                    error = f"{type(response).__name__}: {response}"
+                    logging.warning(f"Ошибка загрузки {url}: {error}")
+                    continue
+
+                status, etag, last_modified, body = response
+                if status == 304:
+                    # Сервер может не повторять валидаторы в ответе 304
+                    etag, last_modified = validators.get(url, (etag, last_modified))
+                    self.stats['not_modified'] += 1
+                elif status == 200 and body:
+                    self.stats['pages'] += 1
+                    extractions.append((url, loop.run_in_executor(pool, extract_contacts, body, url, keywords)))
+                pages.append((url, status, etag, last_modified))
+
+            for url, future in extractions:
+                found = await future
+                for kind in ('email', 'phone', 'inn', 'price_list'):
+                    contacts.extend((kind, value, url) for value in found[kind])
+                for link in found['links']:
+                    if link not in seen:
+                        seen.add(link)
+                        queue.append(link)
+
+        if pages:
+            error = None
+        self.save_domain(domain, pages, contacts, error)
+        self.stats['domains'] += 1
+        logging.info(f"Домен {domain}: страниц {len(pages)}, контактов {len(contacts)}")
+
+    async def crawl(self):
+        """Обход всех доменов из очереди порциями"""
+        connector = aiohttp.TCPConnector(
+            limit=self.settings["max_concurrency"],
+            limit_per_host=self.settings["max_per_host"],
+            ttl_dns_cache=300
+        )
+        timeout = aiohttp.ClientTimeout(total=self.settings["request_timeout"])
+        headers = {
+            'User-Agent': self.settings["user_agent"],
+            'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7'
+        }
+        domain_limit = asyncio.Semaphore(self.settings["max_concurrency"])
+
+        # Выборка задач asyncio при профилировании запуска парсера
+        task_sampler = None
+        if self.profiler:
+            task_sampler = asyncio.create_task(self.profiler.sample_tasks("краулер"))
+
+        async def bounded(domain, start_url):
+            async with domain_limit:
+                try:
+                    await self.crawl_domain(session, pool, domain, start_url)
+                except Exception as e:
+                    logging.error(f"Ошибка при обходе домена {domain}: {str(e)}")
+                    self.save_domain(domain, [], [], str(e))
+
+        try:
+            with ProcessPoolExecutor(max_workers=self.settings["extract_workers"]) as pool:
+                async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers=headers) as session:
+                    while True:
+                        batch = self.load_pending_domains(self.settings["batch_size"])
+                        if not batch:
+                            break
+                        await asyncio.gather(*(bounded(domain, start_url) for domain, start_url in batch))
+        finally:
+            if task_sampler:
+                task_sampler.cancel()
+
+    def run(self):
+        """Запуск обогащения данных поставщиков"""
+        start_time = time.time()
+        logging.info("=" * 50)
+        logging.info("НАЧАЛО ОБОГАЩЕНИЯ ДАННЫХ ПОСТАВЩИКОВ")
+        logging.info("=" * 50)
+
+        self.queue_new_domains()
+        asyncio.run(self.crawl())
+
+        duration = time.time() - start_time
+        logging.info("=" * 50)
+        logging.info("ИТОГИ ОБОГАЩЕНИЯ:")
+        logging.info(f"Время выполнения: {duration:.2f} секунд")
+        logging.info(f"Обработано доменов: {self.stats['domains']}")
+        logging.info(f"Загружено страниц: {self.stats['pages']}, без изменений (304): {self.stats['not_modified']}")
+        logging.info(f"Ошибок загрузки: {self.stats['errors']}")
+        logging.info(f"Новых контактов: {self.stats['contacts']}")
+        logging.info("=" * 50)
+        return self.stats
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=getattr(logging, rules.LOGGING["level"]),
+        format=rules.LOGGING["format"]
+    )
+    SupplierCrawler().run()
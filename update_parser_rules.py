@@ -40,6 +40,8 @@ def update_rules(settings_file):
             "SELECTORS", 
             "ANTI_DETECTION_SCRIPT", 
             "RESULT_PROCESSING", 
+            "CRAWLER_SETTINGS", 
+            "PROFILING", 
             "LOGGING", 
             "SECURITY"
         ]
@@ -107,6 +109,12 @@ def validate_settings():
     if PARSING_SETTINGS["default_num_browsers"] > SECURITY["max_concurrent_browsers"]:
         raise ValueError(f"Default number of browsers exceeds security limit of {SECURITY['max_concurrent_browsers']}")
     
+    if CRAWLER_SETTINGS["max_per_host"] > 4:
+        raise ValueError("Crawler must not open more than 4 connections per host")
+    
+    if CRAWLER_SETTINGS["host_delay"] < 0.5:
+        raise ValueError("Crawler delay per host must be at least 0.5 seconds")
+    
     return True
 
 # Проверяем настройки при импорте
@@ -144,6 +152,8 @@ def create_template():
             "SELECTORS": rules.SELECTORS,
             "ANTI_DETECTION_SCRIPT": rules.ANTI_DETECTION_SCRIPT,
             "RESULT_PROCESSING": rules.RESULT_PROCESSING,
+            "CRAWLER_SETTINGS": rules.CRAWLER_SETTINGS,
+            "PROFILING": rules.PROFILING,
             "LOGGING": rules.LOGGING,
             "SECURITY": rules.SECURITY
         }